@@ -1,7 +1,92 @@
 import argparse
-import glob
+import concurrent.futures
 import os
-import shutil
+
+try:
+    import liburing
+    # Disables the fast path on binding versions with a different api: older releases
+    # lack batched rename support or expose a different completion queue interface
+    if not hasattr(liburing, "io_uring_prep_renameat") or not hasattr(liburing, "io_uring_cqe"):
+        liburing = None
+except ImportError:
+    liburing = None
+
+# Number of rename operations submitted to io_uring in a single enter syscall
+io_uring_queue_depth = 256
+
+
+def flatten_camera_folder(camera_folder_path: str, path: str):
+    '''
+    Moves every entry of the camera folder to the given parent folder
+
+    :param camera_folder_path: path to the camera folder to empty
+    :param path: path to the parent folder receiving the entries
+    :return:
+    '''
+
+    # Scans the directory entries in a single pass and moves each of them to the parent folder
+    with os.scandir(camera_folder_path) as entries:
+        for current_entry in entries:
+            os.rename(current_entry.path, os.path.join(path, current_entry.name))
+
+
+def flatten_camera_folder_io_uring(camera_folder_path: str, path: str):
+    '''
+    Moves every entry of the camera folder to the given parent folder, batching
+    the renames through io_uring so that each batch of operations costs a single
+    enter syscall instead of one syscall per file
+
+    :param camera_folder_path: path to the camera folder to empty
+    :param path: path to the parent folder receiving the entries
+    :return:
+    '''
+
+    # Gathers the names of the entries to move
+    with os.scandir(camera_folder_path) as entries:
+        entry_names = [current_entry.name.encode() for current_entry in entries]
+
+    if len(entry_names) == 0:
+        return
+
+    source_directory_fd = -1
+    destination_directory_fd = -1
+
+    ring = liburing.io_uring()
+    completion_queue_entry = liburing.io_uring_cqe()
+    liburing.io_uring_queue_init(io_uring_queue_depth, ring, 0)
+    try:
+        # Renames are performed relative to the two parent directories
+        source_directory_fd = os.open(camera_folder_path, os.O_RDONLY)
+        destination_directory_fd = os.open(path, os.O_RDONLY)
+
+        # Submits the renames in batches of at most the queue depth
+        for batch_start_index in range(0, len(entry_names), io_uring_queue_depth):
+            current_batch = entry_names[batch_start_index:batch_start_index + io_uring_queue_depth]
+
+            for current_entry_name in current_batch:
+                submission_queue_entry = liburing.io_uring_get_sqe(ring)
+                liburing.io_uring_prep_renameat(submission_queue_entry, current_entry_name, current_entry_name,
+                                                olddfd=source_directory_fd, newdfd=destination_directory_fd)
+
+            # Submits the whole batch with a single syscall and waits for all completions
+            liburing.io_uring_submit_and_wait(ring, len(current_batch))
+
+            # Harvests the completions, checking each one for errors
+            remaining_completions = len(current_batch)
+            while remaining_completions > 0:
+                completed_count = liburing.io_uring_peek_batch_cqe(ring, completion_queue_entry, remaining_completions)
+                for completion_index in range(completed_count):
+                    result = completion_queue_entry[completion_index].res
+                    if result < 0:
+                        raise OSError(-result, os.strerror(-result))
+                liburing.io_uring_cq_advance(ring, completed_count)
+                remaining_completions -= completed_count
+    finally:
+        liburing.io_uring_queue_exit(ring)
+        if source_directory_fd >= 0:
+            os.close(source_directory_fd)
+        if destination_directory_fd >= 0:
+            os.close(destination_directory_fd)
 
 
 def remove_camera_folder(path: str):
@@ -14,15 +99,20 @@ def remove_camera_folder(path: str):
     camera_folder_name = "00000"
     camera_folder_path = os.path.join(path, camera_folder_name)
 
-    all_files = glob.glob(os.path.join(camera_folder_path, "*"))
-
-    for current_file in all_files:
-        basename = os.path.basename(current_file)
-        new_location = os.path.join(path, basename)
-        print(f"Moving {current_file} to {new_location}")
-        os.rename(current_file, new_location)
+    # Uses the io_uring fast path if the bindings are available, falling back to plain
+    # renames if the kernel does not support batched renameat (< 5.11)
+    if liburing is not None:
+        try:
+            flatten_camera_folder_io_uring(camera_folder_path, path)
+        # Covers kernels without batched renameat support as well as residual
+        # differences in the binding api
+        except (OSError, AttributeError, TypeError):
+            flatten_camera_folder(camera_folder_path, path)
+    else:
+        flatten_camera_folder(camera_folder_path, path)
 
-    shutil.rmtree(camera_folder_path)
+    # The camera folder is now empty
+    os.rmdir(camera_folder_path)
 
 
 if __name__ == "__main__":
@@ -35,38 +125,23 @@ if __name__ == "__main__":
 
     root_directory = arguments.directory
 
-    top_level_directories = glob.glob(os.path.join(root_directory, "*"))
-    # Elaborates each top level directory
-    for current_top_level_directory in top_level_directories:
-        if not os.path.isdir(current_top_level_directory):
-            continue
-
-        # Gets all video
-        video_paths_list = sorted(glob.glob(os.path.join(current_top_level_directory, "*")))
-        video_paths_list = [current_path for current_path in video_paths_list if os.path.isdir(current_path)]
-
-        for current_video_path in video_paths_list:
-            remove_camera_folder(current_video_path)
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    # Enumerates directories with scandir so the entry type comes from the directory
+    # listing itself, avoiding a stat syscall per entry
+    with os.scandir(root_directory) as entries:
+        top_level_directories = [current_entry.path for current_entry in entries if current_entry.is_dir()]
 
+    # Gathers the videos of each top level directory
+    all_video_paths = []
+    for current_top_level_directory in top_level_directories:
 
+        # Gets all video, sorted to preserve the processing order
+        with os.scandir(current_top_level_directory) as entries:
+            video_paths_list = sorted(current_entry.path for current_entry in entries if current_entry.is_dir())
 
+        all_video_paths.extend(video_paths_list)
 
+    # Each video is independent, so flattens them concurrently. Threads overlap the
+    # rename and rmdir syscalls which release the GIL
+    max_workers = min(32, os.cpu_count() * 4)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(remove_camera_folder, all_video_paths))
@@ -220,44 +220,46 @@ class Batch:
 
         self.crop_regions = crop_regions
 
-    def to_cuda(self):
+    def to_cuda(self, non_blocking=False):
         '''
         Transfers tensors to the gpu
+        :param non_blocking If True performs the transfers asynchronously with respect to the host
         :return:
         '''
-        self.observations = self.observations.cuda()
-        self.actions = self.actions.cuda()
-        self.rewards = self.rewards.cuda()
-        self.dones = self.dones.cuda()
-        self.camera_rotation = self.camera_rotation.cuda()
-        self.camera_translation = self.camera_translation.cuda()
-        self.focals = self.focals.cuda()
-        self.bounding_boxes = self.bounding_boxes.cuda()
-        self.bounding_boxes_validity = self.bounding_boxes_validity.cuda()
-        self.global_frame_indexes = self.global_frame_indexes.cuda()
-        self.video_frame_indexes = self.video_frame_indexes.cuda()
-        self.video_indexes = self.video_indexes.cuda()
+        self.observations = self.observations.cuda(non_blocking=non_blocking)
+        self.actions = self.actions.cuda(non_blocking=non_blocking)
+        self.rewards = self.rewards.cuda(non_blocking=non_blocking)
+        self.dones = self.dones.cuda(non_blocking=non_blocking)
+        self.camera_rotation = self.camera_rotation.cuda(non_blocking=non_blocking)
+        self.camera_translation = self.camera_translation.cuda(non_blocking=non_blocking)
+        self.focals = self.focals.cuda(non_blocking=non_blocking)
+        self.bounding_boxes = self.bounding_boxes.cuda(non_blocking=non_blocking)
+        self.bounding_boxes_validity = self.bounding_boxes_validity.cuda(non_blocking=non_blocking)
+        self.global_frame_indexes = self.global_frame_indexes.cuda(non_blocking=non_blocking)
+        self.video_frame_indexes = self.video_frame_indexes.cuda(non_blocking=non_blocking)
+        self.video_indexes = self.video_indexes.cuda(non_blocking=non_blocking)
 
         if self.has_flow():
-            self.optical_flows.cuda()
+            self.optical_flows.cuda(non_blocking=non_blocking)
 
         if self.has_keypoints():
-            self.keypoints = self.keypoints.cuda()
-            self.keypoints_validity = self.keypoints_validity.cuda()
+            self.keypoints = self.keypoints.cuda(non_blocking=non_blocking)
+            self.keypoints_validity = self.keypoints_validity.cuda(non_blocking=non_blocking)
 
         if self.has_object_poses():
-            self.object_rotation = self.object_rotation.cuda()
-            self.object_translation = self.object_translation.cuda()
+            self.object_rotation = self.object_rotation.cuda(non_blocking=non_blocking)
+            self.object_translation = self.object_translation.cuda(non_blocking=non_blocking)
 
-    def to_tuple(self, cuda=True) -> Tuple:
+    def to_tuple(self, cuda=True, non_blocking=False) -> Tuple:
         '''
         Converts the batch to an input tuple
         :param cuda If True transfers the tensors to the gpu
+        :param non_blocking If True performs the gpu transfers asynchronously with respect to the host
         :return: (observations, actions, rewards, dones, camera_rotation, camera_translation, focals, bounding_boxes, bounding_boxes_validity, global_frame_indexes, video_frame_indexes, video_indexes) tuple
         '''
 
         if cuda:
-            self.to_cuda()
+            self.to_cuda(non_blocking=non_blocking)
 
         # Do not return optical flow not to break backward compatibility of the code
         return self.observations, self.actions, self.rewards, self.dones, self.camera_rotation, self.camera_translation, \
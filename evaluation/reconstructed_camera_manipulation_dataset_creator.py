@@ -1,3 +1,5 @@
+import concurrent.futures
+import errno
 import os
 import subprocess
 from datetime import datetime
@@ -13,6 +15,71 @@ from model.utils.object_ids_helper import ObjectIDsHelper
 from utils.average_meter import AverageMeter
 from utils.drawing.image_helper import ImageHelper
 
+try:
+    import liburing
+    # Disables the fast path on binding versions with a different api: older releases
+    # lack batched mkdir support or expose a different completion queue interface
+    if not hasattr(liburing, "io_uring_prep_mkdirat") or not hasattr(liburing, "io_uring_cqe"):
+        liburing = None
+except ImportError:
+    liburing = None
+
+# Number of mkdir operations submitted to io_uring in a single enter syscall
+io_uring_queue_depth = 256
+
+
+def make_directories_io_uring(directory_paths):
+    '''
+    Creates the given directories, batching the mkdir calls through io_uring so that a
+    whole batch of operations costs a single enter syscall. Directories that already
+    exist are ignored
+
+    :param directory_paths: iterable of directory paths to create. The parent of each
+                            directory must either exist already or be part of the iterable
+    :return:
+    '''
+
+    # Operations in the same submission may complete in any order, while a parent must
+    # exist before its children, so the directories are created one depth level at a time
+    directories_by_depth = {}
+    for current_path in directory_paths:
+        current_depth = current_path.count(os.sep)
+        directories_by_depth.setdefault(current_depth, []).append(current_path)
+
+    ring = liburing.io_uring()
+    completion_queue_entry = liburing.io_uring_cqe()
+    liburing.io_uring_queue_init(io_uring_queue_depth, ring, 0)
+    try:
+        for current_depth in sorted(directories_by_depth):
+            current_depth_paths = directories_by_depth[current_depth]
+
+            # Submits the mkdirs of the current depth in batches of at most the queue depth
+            for batch_start_index in range(0, len(current_depth_paths), io_uring_queue_depth):
+                # The submission queue entries only reference the path buffers, which the
+                # kernel reads at submission time, so the encoded paths must be kept
+                # alive in a list until the submit returns
+                current_batch = [current_path.encode() for current_path in current_depth_paths[batch_start_index:batch_start_index + io_uring_queue_depth]]
+
+                for current_path in current_batch:
+                    submission_queue_entry = liburing.io_uring_get_sqe(ring)
+                    liburing.io_uring_prep_mkdirat(submission_queue_entry, current_path, 0o777)
+
+                # Submits the whole batch with a single syscall and waits for all completions
+                liburing.io_uring_submit_and_wait(ring, len(current_batch))
+
+                # Harvests the completions. Already existing directories are not an error
+                remaining_completions = len(current_batch)
+                while remaining_completions > 0:
+                    completed_count = liburing.io_uring_peek_batch_cqe(ring, completion_queue_entry, remaining_completions)
+                    for completion_index in range(completed_count):
+                        result = completion_queue_entry[completion_index].res
+                        if result < 0 and result != -errno.EEXIST:
+                            raise OSError(-result, os.strerror(-result))
+                    liburing.io_uring_cq_advance(ring, completed_count)
+                    remaining_completions -= completed_count
+    finally:
+        liburing.io_uring_queue_exit(ring)
+
 
 class ReconstructedCameraManipulationDatasetCreator:
     '''
@@ -33,7 +100,11 @@ class ReconstructedCameraManipulationDatasetCreator:
         self.name = name
         self.dataset = dataset
 
-        self.dataloader = DataLoader(dataset, batch_size=self.config["evaluation"]["reconstructed_camera_manipulation_dataset_batching"]["batch_size"], shuffle=False, collate_fn=single_batch_elements_collate_fn, num_workers=self.config["evaluation"]["reconstructed_camera_manipulation_dataset_batching"]["num_workers"], pin_memory=True)
+        # Workers are kept alive between iterations over the dataset and prefetch
+        # multiple batches ahead of their consumption
+        num_workers = self.config["evaluation"]["reconstructed_camera_manipulation_dataset_batching"]["num_workers"]
+        worker_options = {"persistent_workers": True, "prefetch_factor": 4} if num_workers > 0 else {}
+        self.dataloader = DataLoader(dataset, batch_size=self.config["evaluation"]["reconstructed_camera_manipulation_dataset_batching"]["batch_size"], shuffle=False, collate_fn=single_batch_elements_collate_fn, num_workers=num_workers, pin_memory=True, **worker_options)
 
         # Directory which will serve as the root for the output
         self.output_root = os.path.join(self.config["logging"]["reconstructed_camera_manipulation_dataset_directory"], name)
@@ -45,30 +116,127 @@ class ReconstructedCameraManipulationDatasetCreator:
         # Helper for loggin the images
         self.image_helper = ImageHelper(self.config, logger, name)
 
-    def output_paths_from_observations_paths(self, observations_paths: np.ndarray):
+        # Pool of processes writing the reconstructed images to disk in the background
+        self.writer_pool = concurrent.futures.ProcessPoolExecutor(max_workers=4)
+
+        # Cache of the translated directory of each sequence/camera pair
+        self.translated_directories_cache = {}
+
+        # Cache with the names of the non empty files already present in each output directory
+        self.existing_output_files_cache = {}
+
+        # The dataset is fixed and the translation to output paths is deterministic, so
+        # precomputes the translation of every observation path once
+        output_paths_by_observation_path = {}
+        for current_video in self.dataset.all_videos:
+            for current_camera_video in current_video.videos:
+                for frame_idx in range(current_camera_video.get_frames_count()):
+                    current_observation_path = current_camera_video.get_frame_path_at(frame_idx)
+                    # Frames that are not stored on disk have no path
+                    if current_observation_path is None:
+                        continue
+                    output_paths_by_observation_path[current_observation_path] = self.translate_observation_path(current_observation_path)
+
+        # Stores the mapping as parallel arrays sorted by observation path, with the
+        # observation paths packed in a single contiguous byte buffer, so that a whole
+        # batch is translated with one vectorized binary search instead of one Python
+        # level lookup per element
+        sorted_observation_paths = sorted(output_paths_by_observation_path)
+        try:
+            self.observations_paths_bytes = np.array(sorted_observation_paths, dtype=np.bytes_)
+            self.output_paths_array = np.array([output_paths_by_observation_path[current_path] for current_path in sorted_observation_paths], dtype=object)
+        # Paths with non ascii characters cannot be packed in the byte buffer. Leaves
+        # the buffers empty so translation goes through the per element fallback
+        except UnicodeEncodeError:
+            self.observations_paths_bytes = np.array([], dtype=np.bytes_)
+            self.output_paths_array = np.array([], dtype=object)
+
+        # Creates all output directories upfront so that no directory handling is needed
+        # in the reconstruction loop
+        self.output_directories = {os.path.dirname(current_path) for current_path in output_paths_by_observation_path.values()}
+        self.create_output_directories()
+
+    def create_output_directories(self):
         '''
-        Gets the paths where to save reconstructed images
-
-        :param observations_paths: (batch_size, observations_count, cameras_count) string array with location on disk of the observations. None if the observation is not stored on disk
+        Creates the directories that will hold the reconstructed observations
         :return:
         '''
 
-        # Copies to avoid modifying the original array
-        observations_paths = observations_paths.copy()
+        # Uses batched io_uring mkdirs when the bindings are available, gathering also
+        # the intermediate directories which os.makedirs would otherwise create
+        if liburing is not None:
+            all_directories = set()
+            for directory_path in self.output_directories:
+                current_path = directory_path
+                while current_path.startswith(self.output_root) and current_path != self.output_root and current_path not in all_directories:
+                    all_directories.add(current_path)
+                    current_path = os.path.dirname(current_path)
+            try:
+                make_directories_io_uring(all_directories)
+                return
+            # Falls back to plain mkdirs if the kernel does not support batched
+            # mkdirat (< 5.15) or the binding api differs from the expected one
+            except (OSError, AttributeError, TypeError):
+                pass
+
+        for directory_path in self.output_directories:
+            os.makedirs(directory_path, exist_ok=True)
+
+    def translate_observation_path(self, observation_path: str) -> str:
+        '''
+        Gets the path where to save the reconstruction of the observation at the given path
+
+        :param observation_path: location on disk of the observation .../sequence_name/camera_name/file_name
+        :return: path under the output root output_root/sequence_name/camera_name/file_name
+        '''
 
-        # Iterates over all paths with a writable iterator
-        with np.nditer(observations_paths, flags=["refs_ok"], op_flags=['readwrite']) as iterator:
-            for current_path in iterator:
+        # Separates the file name from its directory
+        filename_index = observation_path.rfind(os.sep)
+        directory_path = observation_path[:filename_index]
 
-                # Splits the path .../sequence_name/camera_name/file_name
-                path = os.path.normpath(current_path.item()).split(os.sep)[-3:]
-                # Concatenates the path with the new output root
-                # output_root/sequence_name/camera_name/file_name
-                translated_path = os.path.join(self.output_root, os.path.join(*path))
+        # All frames of a sequence/camera pair share the same directory, so its
+        # translation is cached and only the file name changes between calls
+        translated_directory = self.translated_directories_cache.get(directory_path)
+        if translated_directory is None:
+            # Finds the beginning of the sequence_name/camera_name components with a
+            # backwards search avoiding a full path normalization and split
+            cut_index = directory_path.rfind(os.sep)
+            cut_index = directory_path.rfind(os.sep, 0, cut_index)
+            translated_directory = self.output_root + directory_path[cut_index:]
+            self.translated_directories_cache[directory_path] = translated_directory
 
-                current_path[...] = translated_path
+        return translated_directory + observation_path[filename_index:]
+
+    def output_paths_from_observations_paths(self, observations_paths: np.ndarray):
+        '''
+        Gets the paths where to save reconstructed images
+
+        :param observations_paths: (batch_size, observations_count, cameras_count) string array with location on disk of the observations. None if the observation is not stored on disk
+        :return:
+        '''
 
-        return observations_paths
+        # The translations of every dataset path are precomputed in contiguous buffers
+        # sorted by observation path, so the whole batch is translated with a single
+        # vectorized binary search. Falls back to translating directly if some path is
+        # not part of the precomputed mapping
+        if len(self.observations_paths_bytes) > 0:
+            try:
+                # The extra byte lets paths longer than any precomputed one show up as mismatches
+                observations_paths_bytes = observations_paths.astype(f"S{self.observations_paths_bytes.dtype.itemsize + 1}")
+            except UnicodeEncodeError:
+                observations_paths_bytes = None
+
+            if observations_paths_bytes is not None:
+                indexes = np.searchsorted(self.observations_paths_bytes, observations_paths_bytes)
+                indexes = np.minimum(indexes, len(self.observations_paths_bytes) - 1)
+                if np.all(self.observations_paths_bytes[indexes] == observations_paths_bytes):
+                    return self.output_paths_array[indexes]
+
+        # Translates all paths, building a new array so the original one is left untouched
+        translated_paths = [self.translate_observation_path(current_path) for current_path in observations_paths.flat]
+        output_paths = np.array(translated_paths, dtype=object).reshape(observations_paths.shape)
+
+        return output_paths
 
     def make_folders_for_output(self, paths: np.ndarray):
         '''
@@ -78,19 +246,41 @@ class ReconstructedCameraManipulationDatasetCreator:
         :return:
         '''
 
-        # Iterates over all directories
-        with np.nditer(paths, flags=["refs_ok"]) as iterator:
-            for current_path in iterator:
+        # Many paths share the same parent directory, so computes the set of unique
+        # directories first and creates each of them with a single call
+        directory_paths = {os.path.dirname(current_path) for current_path in paths.flat}
 
-                directory_path = current_path.item()
+        for directory_path in directory_paths:
+            os.makedirs(directory_path, exist_ok=True)
 
-                # Strips the file name from the path if it is not a directory path
-                if not os.path.isdir(directory_path):
-                    directory_path = os.path.normpath(current_path.item()).split(os.sep)[:-1]
-                    directory_path = os.path.join(*directory_path)
+    def batch_outputs_exist(self, output_paths: np.ndarray) -> bool:
+        '''
+        Checks whether all the given output files already exist and are non empty
+
+        :param output_paths: (...) string array with paths to output files
+        :return: True if every output file exists and is non empty
+        '''
+
+        for current_path in output_paths.flat:
+            directory_path, filename = os.path.split(current_path)
+
+            # Each output directory is scanned only once, caching the names of its non empty files
+            existing_files = self.existing_output_files_cache.get(directory_path)
+            if existing_files is None:
+                existing_files = set()
+                try:
+                    with os.scandir(directory_path) as entries:
+                        for current_entry in entries:
+                            if current_entry.is_file() and current_entry.stat().st_size > 0:
+                                existing_files.add(current_entry.name)
+                except FileNotFoundError:
+                    pass
+                self.existing_output_files_cache[directory_path] = existing_files
+
+            if filename not in existing_files:
+                return False
 
-                # Creates the directory
-                Path(directory_path).mkdir(exist_ok=True, parents=True)
+        return True
 
     def use_first_observation(self, tensor: torch.Tensor) -> torch.Tensor:
         '''
@@ -103,13 +293,41 @@ class ReconstructedCameraManipulationDatasetCreator:
         observations_count = tensor.size(1)
         tensor = tensor[:, :1] # Selects the first observation
 
-        # Repeats the first observation
-        repeats = [1] * len(tensor.size())
-        repeats[1] = observations_count
-        tensor = tensor.repeat(repeats)
+        # Broadcasts the first observation to all observation steps. The expansion is a
+        # view, so no memory is allocated for the repetitions
+        expanded_size = list(tensor.size())
+        expanded_size[1] = observations_count
+        tensor = tensor.expand(expanded_size)
 
         return tensor
 
+    def prefetched_batches(self):
+        '''
+        Iterates over the dataloader transferring each batch to the gpu one step ahead
+        of its consumption on a dedicated copy stream, so that host to device copies
+        overlap with the compute of the preceding batch
+
+        :return: generator of (batch, batch_tuple, copy_event) with the tuple tensors on the gpu.
+                 The copy event must be waited on by the consuming stream before using the tensors
+        '''
+
+        copy_stream = torch.cuda.Stream()
+        prefetched_batch = None
+
+        for current_batch in self.dataloader:
+            # Starts the transfer of the new batch on the copy stream
+            with torch.cuda.stream(copy_stream):
+                current_batch_tuple = current_batch.to_tuple(non_blocking=True)
+            copy_event = torch.cuda.Event()
+            copy_event.record(copy_stream)
+
+            if prefetched_batch is not None:
+                yield prefetched_batch
+            prefetched_batch = (current_batch, current_batch_tuple, copy_event)
+
+        if prefetched_batch is not None:
+            yield prefetched_batch
+
     def reconstruct_dataset(self, model):
         '''
         Evaluates the performances of the given model
@@ -122,17 +340,40 @@ class ReconstructedCameraManipulationDatasetCreator:
         self.logger.print(f"- Reconstructing dataset '{self.name}'")
 
         batches_count = len(self.dataloader)
+        # Logs at most ~100 progress lines so that stdout flushes do not serialize
+        # with the gpu work on large datasets
+        log_interval = max(1, batches_count // 100)
 
-        # Saves sample images
-        with torch.no_grad():
-            for batch_idx, batch in enumerate(self.dataloader):
+        # Futures for the image writes submitted to the background writer pool
+        pending_image_writes = []
 
-                self.logger.print(f"-- [{batch_idx:04d}/{batches_count:04d}] [{datetime.now()}] Reconstructing batch")
+        # Saves sample images. Inference is performed in mixed precision: gradients are
+        # not needed, so no loss scaling is required and the halved tensor width
+        # directly increases render throughput
+        with torch.no_grad(), torch.cuda.amp.autocast():
+            for batch_idx, (batch, batch_tuple, copy_event) in enumerate(self.prefetched_batches()):
+
+                if batch_idx % log_interval == 0:
+                    self.logger.print(f"-- [{batch_idx:04d}/{batches_count:04d}] [{datetime.now()}] Reconstructing batch")
+
+                observations_paths = batch.observations_paths  # Paths where the current observations are stored on disk
+                # Gets output filenames for the current batch. The output directories
+                # have already been created at construction time
+                output_paths = self.output_paths_from_observations_paths(observations_paths)
+
+                # Skips the whole batch if all its outputs were already produced by a
+                # previous run, so resuming only pays a cached directory scan per batch
+                if self.batch_outputs_exist(output_paths):
+                    continue
+
+                # Waits for the transfer of the current batch started on the copy stream
+                # and ties the lifetime of the transferred tensors to the compute stream
+                torch.cuda.current_stream().wait_event(copy_event)
+                for current_tensor in batch_tuple:
+                    current_tensor.record_stream(torch.cuda.current_stream())
 
                 # Performs inference
-                batch_tuple = batch.to_tuple()
                 observations, actions, rewards, dones, camera_rotations, camera_translations, focals, bounding_boxes, bounding_boxes_validity, global_frame_indexes, video_frame_indexes, video_indexes = batch_tuple
-                observations_paths = batch.observations_paths  # Paths where the current observations are stored on disk
 
                 scene_encoding = model(observations, camera_rotations, camera_translations, focals, bounding_boxes, bounding_boxes_validity, global_frame_indexes, video_frame_indexes, video_indexes, shuffle_style=False, mode="observations_scene_encoding_only")
 
@@ -154,17 +395,20 @@ class ReconstructedCameraManipulationDatasetCreator:
 
                 render_results = model.module.render_full_frame_from_scene_encoding(camera_rotations, camera_translations, focals, image_size, object_rotation_parameters, object_translation_parameters, object_style, object_deformation, object_in_scene, perturb=False)
 
-                # Gets output filenames and creates output directories for the current batch
-                output_paths = self.output_paths_from_observations_paths(observations_paths)
-                self.make_folders_for_output(output_paths)
+                # Submits the image writes to the background pool so that the next batch
+                # can start its forward pass without waiting for the disk
+                pending_image_writes.extend(self.image_helper.save_reconstructed_images_to_paths(render_results, output_paths, executor=self.writer_pool))
 
-                self.image_helper.save_reconstructed_images_to_paths(render_results, output_paths)
+        # Waits for all background image writes to complete, propagating their exceptions
+        concurrent.futures.wait(pending_image_writes)
+        for current_write in pending_image_writes:
+            current_write.result()
 
         self.logger.print(f"- Syncing metadata '{self.name}'")
 
         # Uses rsync to sync the dataset metadata
         original_dataset_directory = os.path.join(self.config["evaluation"]["reconstructed_camera_manipulation_dataset_path"], self.name) + "/"
-        rsync_args = ["rsync", "-a", "--ignore-times", "--exclude", "*.png", original_dataset_directory, self.output_root]  # Forces to overwrite files independently from time
+        rsync_args = ["rsync", "-a", "--size-only", "--exclude", "*.png", original_dataset_directory, self.output_root]  # Compares files by size only, avoiding checksums of unchanged files
         subprocess.run(rsync_args)
 
         self.logger.print(f"- Done reconstructing dataset '{self.name}'")
@@ -58,22 +58,20 @@ class ReconstructedPlayabilityDatasetCreator:
         :return:
         '''
 
-        # Copies to avoid modifying the original array
-        observations_paths = observations_paths.copy()
+        # Plain iteration over the flat array is faster than nditer, which provides no
+        # vectorization benefit on object arrays. A new array is built so the original
+        # one is left untouched
+        translated_paths = []
+        for current_path in observations_paths.flat:
+            # Splits the path .../sequence_name/camera_name/file_name
+            path = os.path.normpath(current_path).split(os.sep)[-3:]
+            # Concatenates the path with the new output root
+            # output_root/sequence_name/camera_name/file_name
+            translated_paths.append(os.path.join(self.output_root, os.path.join(*path)))
 
-        # Iterates over all paths with a writable iterator
-        with np.nditer(observations_paths, flags=["refs_ok"], op_flags=['readwrite']) as iterator:
-            for current_path in iterator:
+        output_paths = np.array(translated_paths, dtype=object).reshape(observations_paths.shape)
 
-                # Splits the path .../sequence_name/camera_name/file_name
-                path = os.path.normpath(current_path.item()).split(os.sep)[-3:]
-                # Concatenates the path with the new output root
-                # output_root/sequence_name/camera_name/file_name
-                translated_path = os.path.join(self.output_root, os.path.join(*path))
-
-                current_path[...] = translated_path
-
-        return observations_paths
+        return output_paths
 
     def metadata_output_paths_from_observations_paths(self, metadata_paths: np.ndarray):
         '''
@@ -83,22 +81,20 @@ class ReconstructedPlayabilityDatasetCreator:
         :return:
         '''
 
-        # Copies to avoid modifying the original array
-        metadata_paths = metadata_paths.copy()
-
-        # Iterates over all paths with a writable iterator
-        with np.nditer(metadata_paths, flags=["refs_ok"], op_flags=['readwrite']) as iterator:
-            for current_path in iterator:
-
-                # Splits the path .../sequence_name/camera_name/file_name
-                path = os.path.normpath(current_path.item()).split(os.sep)[-3:-1]
-                # Concatenates the path with the new output root
-                # output_root/sequence_name/camera_name
-                translated_path = os.path.join(self.output_root, os.path.join(*path), Video.metadata_filename)
+        # Plain iteration over the flat array is faster than nditer, which provides no
+        # vectorization benefit on object arrays. A new array is built so the original
+        # one is left untouched
+        translated_paths = []
+        for current_path in metadata_paths.flat:
+            # Splits the path .../sequence_name/camera_name/file_name
+            path = os.path.normpath(current_path).split(os.sep)[-3:-1]
+            # Concatenates the path with the new output root
+            # output_root/sequence_name/camera_name
+            translated_paths.append(os.path.join(self.output_root, os.path.join(*path), Video.metadata_filename))
 
-                current_path[...] = translated_path
+        output_paths = np.array(translated_paths, dtype=object).reshape(metadata_paths.shape)
 
-        return metadata_paths
+        return output_paths
 
     def make_folders_for_output(self, paths: np.ndarray):
         '''
@@ -108,19 +104,19 @@ class ReconstructedPlayabilityDatasetCreator:
         :return:
         '''
 
-        # Iterates over all directories
-        with np.nditer(paths, flags=["refs_ok"]) as iterator:
-            for current_path in iterator:
+        # Iterates over all directories. Plain iteration over the flat array is faster
+        # than nditer, which provides no vectorization benefit on object arrays
+        for current_path in paths.flat:
 
-                directory_path = current_path.item()
+            directory_path = current_path
 
-                # Strips the file name from the path if it is not a directory path
-                if not os.path.isdir(directory_path):
-                    directory_path = os.path.normpath(current_path.item()).split(os.sep)[:-1]
-                    directory_path = os.path.join(*directory_path)
+            # Strips the file name from the path if it is not a directory path
+            if not os.path.isdir(directory_path):
+                directory_path = os.path.normpath(current_path).split(os.sep)[:-1]
+                directory_path = os.path.join(*directory_path)
 
-                # Creates the directory
-                Path(directory_path).mkdir(exist_ok=True, parents=True)
+            # Creates the directory
+            Path(directory_path).mkdir(exist_ok=True, parents=True)
 
     def compute_dynamic_object_parameters(self, object_results: Dict) -> Tuple:
         '''
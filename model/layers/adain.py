@@ -1,5 +1,6 @@
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 
 
 class AffineTransformAdaIn(nn.Module):
@@ -10,6 +11,7 @@ class AffineTransformAdaIn(nn.Module):
     def __init__(self, in_features: int, style_features_count: int):
         super(AffineTransformAdaIn, self).__init__()
 
+        self.in_features = in_features
         self.style_features_count = style_features_count
         self.affine_transform = nn.Linear(self.style_features_count, 2 * in_features)
         self.ada_in = AdaIn(in_features)
@@ -28,8 +30,9 @@ class AffineTransformAdaIn(nn.Module):
 
         # Applies affine transformation to produce the style
         encoded_style = self.affine_transform(style)
-        # Separates scale from bias
-        scale, bias = encoded_style.chunk(2, 1)
+        # Separates scale from bias through zero copy views
+        scale = encoded_style[:, :self.in_features]
+        bias = encoded_style[:, self.in_features:]
         # Performs adaptive instance normalization
         output = self.ada_in(input, scale, bias)
 
@@ -44,7 +47,26 @@ class AdaIn(nn.Module):
     def __init__(self, in_features: int):
         super(AdaIn, self).__init__()
 
-        self.normalization = nn.BatchNorm1d(in_features, affine=False)
+        self.momentum = 0.1
+        self.eps = 1e-5
+
+        # Running statistics for the non affine normalization
+        self.register_buffer("running_mean", torch.zeros(in_features))
+        self.register_buffer("running_var", torch.ones(in_features))
+
+    def _load_from_state_dict(self, state_dict, prefix, local_metadata, strict, missing_keys, unexpected_keys, error_msgs):
+        '''
+        Remaps checkpoints saved when the normalization was a BatchNorm1d submodule
+        '''
+
+        for buffer_name in ["running_mean", "running_var"]:
+            old_key = prefix + "normalization." + buffer_name
+            if old_key in state_dict:
+                state_dict[prefix + buffer_name] = state_dict.pop(old_key)
+        # The batch counter of the old submodule is no longer tracked
+        state_dict.pop(prefix + "normalization.num_batches_tracked", None)
+
+        super(AdaIn, self)._load_from_state_dict(state_dict, prefix, local_metadata, strict, missing_keys, unexpected_keys, error_msgs)
 
     def forward(self, input, scale, bias):
         '''
@@ -55,7 +77,11 @@ class AdaIn(nn.Module):
         :return:
         '''
 
-        result = self.normalization(input)
-        result = result * scale + bias
+        # Normalizes without affine parameters. The scale and bias differ for each batch
+        # element, so they cannot be applied through the per feature affine parameters
+        # of batch normalization
+        result = F.batch_norm(input, self.running_mean, self.running_var, training=self.training, momentum=self.momentum, eps=self.eps)
+        # Applies scale and bias in a single fused pointwise kernel
+        result = torch.addcmul(bias, result, scale)
 
         return result
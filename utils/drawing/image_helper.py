@@ -1,7 +1,9 @@
+import concurrent.futures
 import os
 from typing import Tuple, Dict, List
 
 import PIL
+import cv2 as cv
 import numpy as np
 import torch
 import torch.nn.functional as F
@@ -16,6 +18,49 @@ from utils.logger import Logger
 from utils.tensor_folder import TensorFolder
 
 
+def save_images_to_paths_worker(images: np.ndarray, output_paths: np.ndarray, crop_regions: np.ndarray=None, target_output_size: Tuple[int]=None):
+    '''
+    Saves each image to its corresponding output path.
+    Defined at module level so that it can be submitted to a process pool
+
+    :param images: (elements_count, height, width, 3) uint8 array with the images to save
+    :param output_paths: (elements_count) string array with the output path for each image
+    :param crop_regions: (elements_count, 4) int array of (left, top, right, bottom) pixel coordinates where to crop each image
+                        If None performs no cropping
+    :param target_output_size: (width, height) target output size. Used only if crop is specified
+    :return:
+    '''
+
+    # Low compression level: the opencv png encoder at low compression is several
+    # times faster than PIL at the cost of slightly larger files
+    imwrite_options = [cv.IMWRITE_PNG_COMPRESSION, 1]
+
+    elements_count = images.shape[0]
+    for element_idx in range(elements_count):
+
+        current_image = images[element_idx]
+
+        # Crop the image if crops are requested
+        if crop_regions is not None:
+            pil_image = Image.fromarray(current_image)
+            pil_image = pil_image.crop(crop_regions[element_idx].tolist())
+            pil_image = pil_image.resize(target_output_size, PIL.Image.LANCZOS)
+            current_image = np.asarray(pil_image)
+
+        # Writes to a temporary file and atomically renames it into place. Successive
+        # batches cover overlapping observation windows and may submit the same path to
+        # different workers, so writing in place could interleave or truncate the file;
+        # with the rename every reader only ever observes a complete image
+        current_output_path = output_paths[element_idx]
+        temporary_path = f"{current_output_path}.{os.getpid()}.tmp.png"
+
+        # opencv expects bgr channel ordering. imwrite signals failure through its
+        # return value instead of raising, so it must be checked explicitly
+        if not cv.imwrite(temporary_path, current_image[:, :, ::-1], imwrite_options):
+            raise Exception(f"Could not write image to '{current_output_path}'")
+        os.rename(temporary_path, current_output_path)
+
+
 class ImageHelper:
 
     def __init__(self, config, logger: Logger, logger_prefix: str):
@@ -410,7 +455,7 @@ class ImageHelper:
 
         return input
 
-    def save_reconstructed_images_to_paths(self, render_results: Dict, output_paths: np.ndarray, crop_regions: np.ndarray=None, target_output_size: Tuple[int]=None):
+    def save_reconstructed_images_to_paths(self, render_results: Dict, output_paths: np.ndarray, crop_regions: np.ndarray=None, target_output_size: Tuple[int]=None, executor: concurrent.futures.Executor=None) -> List[concurrent.futures.Future]:
         '''
         Saves the reconstructed images from the given results
 
@@ -419,13 +464,21 @@ class ImageHelper:
         :param crop_regions: (batch_size, observations_count, cameras_count, 4) array of (left, top, right, bottom) coordinates in [0, 1] where to crop each image
                             If None performs no cropping
         :param target_output_size (width, height) target output size. Used only if crop is specified
-        :return:
+        :param executor: executor to which to submit the image writes. If None the images are written synchronously
+        :return: list of futures for the submitted image writes. Empty if executor is None
         '''
 
-        for result_type in render_results.keys():
-            # Filters away undesired keys
-            if result_type not in ["coarse", "fine"]:
-                continue
+        pending_futures = []
+
+        # Filters away undesired keys. When both the coarse and the fine renders are
+        # present only the fine one is saved: both target the same output paths, and
+        # writing them from concurrent workers would make the final content a race.
+        # The fine render is the one the sequential writes previously left on disk
+        result_types = [current_type for current_type in render_results.keys() if current_type in ["coarse", "fine"]]
+        if "fine" in result_types:
+            result_types = ["fine"]
+
+        for result_type in result_types:
 
             current_type_render_results = render_results[result_type]
             # Saves the rendering for each object
@@ -456,7 +509,11 @@ class ImageHelper:
                 flattened_reconstructed_observations, _ = TensorFolder.flatten(reconstructed_observations, dimensions=-3)
                 flattened_output_paths = output_paths.reshape((-1,))
                 # Prepares the crop regions converting them to pixel image coordinates
+                flattened_crop_regions = None
                 if crop_regions is not None:
+                    if target_output_size is None:
+                        target_output_size = (width, height)
+
                     crop_regions = crop_regions.copy()
                     flattened_crop_regions = crop_regions.reshape((-1, 4))
                     flattened_crop_regions[:, 0] *= width
@@ -464,33 +521,29 @@ class ImageHelper:
                     flattened_crop_regions[:, 2] *= width
                     flattened_crop_regions[:, 3] *= height
                     flattened_crop_regions = np.rint(flattened_crop_regions).astype(int)
+                elif target_output_size is not None:
+                    raise Exception("Target output size can be used only if crop is specified")
 
                 elements_count = flattened_reconstructed_observations.size(0)
                 paths_count = flattened_output_paths.shape[0]
                 if elements_count != paths_count:
                     raise Exception(f"The number of images ({elements_count}) is different from the number of paths ({paths_count})")
 
-                # Saves each image
-                for element_idx in range(elements_count):
-
-                    current_reconstructed_observation = flattened_reconstructed_observations[element_idx]
-                    current_output_path = flattened_output_paths[element_idx]
-
-                    # Crop the image if crops are requested
-                    if crop_regions is not None:
-                        if target_output_size is None:
-                            target_output_size = (width, height)
-
-                        current_crop_region = flattened_crop_regions[element_idx].tolist()
-                        pil_image = torchvision.transforms.ToPILImage()(current_reconstructed_observation)
-                        pil_image = pil_image.crop(current_crop_region)
-                        pil_image = pil_image.resize(target_output_size, PIL.Image.LANCZOS)
-                        pil_image.save(current_output_path)
-                    # No crop, save images normally
-                    else:
-                        if target_output_size is not None:
-                            raise Exception("Target output size can be used only if crop is specified")
-                        save_image(current_reconstructed_observation, current_output_path)
+                # Converts the images to uint8 numpy arrays on the calling thread so that
+                # the writes only handle plain arrays and can be offloaded to other processes
+                # Images may come from a mixed precision render, so they are brought back
+                # to full precision before quantization
+                flattened_images = (flattened_reconstructed_observations.float() * 255).round().clamp(0, 255).to(torch.uint8)
+                flattened_images = flattened_images.permute(0, 2, 3, 1).cpu().numpy()
+
+                # Saves the images, offloading the writes to the executor if one is given so
+                # that the gpu can immediately begin the next batch
+                if executor is not None:
+                    pending_futures.append(executor.submit(save_images_to_paths_worker, flattened_images, flattened_output_paths, flattened_crop_regions, target_output_size))
+                else:
+                    save_images_to_paths_worker(flattened_images, flattened_output_paths, flattened_crop_regions, target_output_size)
+
+        return pending_futures
 
 
 